@@ -0,0 +1,135 @@
+import logging
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from typing import Optional
+
+from src.core.config import active_index_conflicts, settings
+from src.services.model_migration import migration_manager
+from src.services.rag_service import rag_service
+from src.services.snapshot import SnapshotShard, snapshot_store
+from src.utils.profiler import request_profiler
+
+logger = logging.getLogger(__name__)
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject requests that do not carry the configured admin token"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+class ProfilingConfig(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None
+
+class MigrationRequest(BaseModel):
+    text_model_name: Optional[str] = None
+    image_model_name: Optional[str] = None
+    max_docs_per_second: Optional[float] = None
+    force: bool = False  # Switch over even if some documents could not be re-embedded
+
+@router.get("/profiling")
+async def get_profiling():
+    """Current profiling mode and stored profiles"""
+    return {
+        "enabled": request_profiler.enabled,
+        "sample_rate": request_profiler.sample_rate,
+        "header": settings.PROFILING_HEADER,
+        "profiles": request_profiler.list_profiles()
+    }
+
+@router.put("/profiling")
+async def update_profiling(config: ProfilingConfig):
+    """Enable/disable profiling or change the sample rate"""
+    try:
+        request_profiler.configure(enabled=config.enabled, sample_rate=config.sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "enabled": request_profiler.enabled,
+        "sample_rate": request_profiler.sample_rate
+    }
+
+@router.get("/profiling/{profile_id}/{filename}")
+async def download_trace(profile_id: str, filename: str):
+    """Download a stored trace file"""
+    path = request_profiler.get_trace_file(profile_id, filename)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FileResponse(path, filename=f"{profile_id}_{filename}")
+
+@router.get("/snapshots")
+async def list_snapshots():
+    """Snapshots available for replica bootstrap"""
+    return {
+        "directory": str(snapshot_store.directory),
+        "snapshots": snapshot_store.list_snapshots(),
+        "chain_gap": snapshot_store.chain_gap()
+    }
+
+@router.post("/snapshots")
+async def create_snapshot():
+    """Export documents added since the last snapshot"""
+    try:
+        snapshot = await snapshot_store.create(rag_service.index)
+    except Exception as e:
+        logger.error(f"Error creating snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "created" if snapshot else "unchanged", "snapshot": snapshot}
+
+@router.get("/snapshots/{name}")
+async def download_snapshot(name: str):
+    """Download a snapshot file"""
+    path = snapshot_store.get_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
+
+@router.post("/snapshots/reload")
+async def reload_snapshots():
+    """Map snapshot files newly copied into SNAPSHOT_RESTORE_DIRECTORY"""
+    shards = [shard for shard in rag_service.index.read_only_shards if isinstance(shard, SnapshotShard)]
+    if not shards:
+        raise HTTPException(status_code=400, detail="SNAPSHOT_RESTORE_DIRECTORY is not configured")
+    loaded = sum(shard.reload() for shard in shards)
+    return {
+        "loaded": loaded,
+        "documents": sum(shard.count() for shard in shards),
+        "chain_gaps": [shard.gap for shard in shards if shard.gap]
+    }
+
+@router.get("/migration")
+async def get_migration():
+    """Progress and throughput of the current or last model migration"""
+    if migration_manager.current is None:
+        return {"state": "idle", "active_index_conflicts": active_index_conflicts}
+    return {**migration_manager.current.status(), "active_index_conflicts": active_index_conflicts}
+
+@router.post("/migration")
+async def start_migration(request: MigrationRequest):
+    """Re-embed the corpus with new models in the background, then switch over"""
+    try:
+        migration = migration_manager.start(
+            text_model_name=request.text_model_name,
+            image_model_name=request.image_model_name,
+            max_docs_per_second=request.max_docs_per_second,
+            force=request.force
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return migration.status()
+
+@router.delete("/migration")
+async def cancel_migration():
+    """Cancel a migration that has not switched over yet"""
+    try:
+        migration = migration_manager.cancel()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"migration_id": migration.migration_id, "status": "cancelling"}
@@ -116,18 +116,43 @@ async def add_document(
         # Generate embedding
         embedding_data = await embedding_service.generate_embedding(
             text=content,
-            image_path=image_path
+            image_path=image_path,
+            cache_image=True
         )
+        if not rag_service.serves(embedding_data["model_used"]):
+            # Models switched over and the old index was dropped meanwhile
+            embedding_data = await embedding_service.generate_embedding(
+                text=content,
+                image_path=image_path,
+                cache_image=True
+            )
+
+        metadata = {"user_uploaded": True}
+        if image_path:
+            # Kept so the image can be re-embedded when models change
+            metadata["image_path"] = image_path
+        duplicate_of = embedding_data["duplicate_of"]
+        if embedding_data["image_hash"]:
+            metadata["image_hash"] = embedding_data["image_hash"]
+        if duplicate_of:
+            if settings.PHASH_REJECT_DUPLICATES:
+                logger.info(f"Rejected near-duplicate image of document {duplicate_of[0]}")
+                # Nothing references a rejected upload, so do not keep it
+                if os.path.exists(image_path):
+                    os.remove(image_path)
+                return {"document_id": None, "status": "duplicate", "duplicate_of": duplicate_of}
+            metadata["duplicate_of"] = duplicate_of[0]
 
         # Add to vector store
         doc_id = await rag_service.add_document(
             content=content,
             media_type=embedding_data["media_type"],
             embedding=embedding_data["embedding"],
-            metadata={"user_uploaded": True}
+            metadata=metadata,
+            model_used=embedding_data["model_used"]
         )
 
-        return {"document_id": doc_id, "status": "success"}
+        return {"document_id": doc_id, "status": "success", "duplicate_of": duplicate_of}
 
     except Exception as e:
         logger.error(f"Error adding document: {str(e)}")
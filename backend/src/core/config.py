@@ -1,10 +1,14 @@
+import json
+import logging
 import os
-from typing import Optional
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Settings(BaseSettings):
     # API Configuration
     PROJECT_NAME: str = "Multimodal AI Backend"
@@ -14,18 +18,33 @@ class Settings(BaseSettings):
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 60 minutes * 24 hours * 8 days = 8 days
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")  # Empty disables the admin API
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./multimodal.db")
     
     # Vector Database
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
+    CHROMA_COLLECTION_NAME: str = "multimodal_rag"
+    VECTOR_SHARD_COUNT: int = 1  # Local shards under CHROMA_PERSIST_DIRECTORY when no addresses are set
+    VECTOR_SHARD_ADDRESSES: list = []  # Shard servers, e.g. ["127.0.0.1:9101", "127.0.0.1:9102"]
+    VECTOR_SHARD_KEY: str = ""  # Metadata field to partition by (e.g. "media_type", "tenant"); empty hashes ids
+    VECTOR_SHARD_TIMEOUT: float = 10.0  # Seconds to wait for a remote shard
+    VECTOR_SHARD_AUTHKEY: str = os.getenv("VECTOR_SHARD_AUTHKEY", "")  # Shared secret for shard servers, required with VECTOR_SHARD_ADDRESSES
+    SNAPSHOT_DIRECTORY: str = "./snapshots"  # Where index snapshots are exported
+    SNAPSHOT_RESTORE_DIRECTORY: str = ""  # Serve queries from snapshots mmapped from this directory
     
     # Model Configurations
     IMAGE_MODEL_NAME: str = "google/vit-base-patch16-224-in21k"  # More widely available
     TEXT_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"  # Lighter, faster
     EMBEDDING_DIM: int = 768
     
+    # Model Migration (re-embedding into a shadow index)
+    ACTIVE_INDEX_FILE: str = "./chroma_db/active_index.json"  # Written when a migration switches over
+    MIGRATION_MAX_DOCS_PER_SECOND: float = 5.0
+    MIGRATION_BATCH_SIZE: int = 32
+    MIGRATION_SWITCH_GRACE_SECONDS: float = 5.0  # Wait for in-flight old-model writes before the final catch-up
+    
     # Redis for caching and Celery
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     
@@ -33,7 +52,69 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB
     ALLOWED_IMAGE_TYPES: list = ["image/jpeg", "image/png", "image/jpg"]
     
+    # Near-duplicate Images (perceptual hash)
+    PHASH_DEDUP_ENABLED: bool = True
+    PHASH_MAX_DISTANCE: int = 6  # Hamming distance (out of 64 bits) treated as a near-duplicate
+    PHASH_REJECT_DUPLICATES: bool = False  # Reject near-duplicate documents instead of flagging them
+    PHASH_CACHE_SIZE: int = 10000  # Image embeddings kept for reuse
+    
+    # Logging
+    LOG_FILE: str = "multimodal_backend.log"
+    
+    # Request Profiling
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0  # Fraction of requests profiled when enabled
+    PROFILING_HEADER: str = "X-Profile-Request"  # Must carry ADMIN_TOKEN to force a profile
+    PROFILING_TRACE_DIR: str = "./profiles"
+    PROFILING_MAX_TRACES: int = 50
+    
     class Config:
         case_sensitive = True
 
-settings = Settings()
\ No newline at end of file
+    def apply_active_index(self) -> List[str]:
+        """Use the collection and models chosen by the last completed model migration
+
+        An explicit CHROMA_COLLECTION_NAME (environment or .env) opts out of
+        the file entirely. Otherwise explicit model names must match the
+        models the migrated collection was built with, since pairing another
+        model with it would compare vectors from different embedding spaces.
+        Disagreements that are safe to start with are logged and returned.
+        """
+        if not os.path.exists(self.ACTIVE_INDEX_FILE):
+            return []
+        with open(self.ACTIVE_INDEX_FILE) as file:
+            active = json.load(file)
+        described = (
+            f"Collection '{active['collection']}' in {self.ACTIVE_INDEX_FILE} holds vectors from"
+            f" {active['text_model']}+{active['image_model']}"
+        )
+
+        conflicts = []
+        if "CHROMA_COLLECTION_NAME" in self.model_fields_set:
+            if self.CHROMA_COLLECTION_NAME != active["collection"]:
+                conflicts.append(
+                    f"CHROMA_COLLECTION_NAME={self.CHROMA_COLLECTION_NAME!r} overrides the migrated index."
+                    f" {described}; it is ignored along with its models."
+                )
+        else:
+            mismatched = [
+                f"{field}={getattr(self, field)!r}"
+                for field, key in (("TEXT_MODEL_NAME", "text_model"), ("IMAGE_MODEL_NAME", "image_model"))
+                if field in self.model_fields_set and getattr(self, field) != active[key]
+            ]
+            if mismatched:
+                raise RuntimeError(
+                    f"{', '.join(mismatched)} cannot serve the migrated index. {described};"
+                    f" unset the model settings, also set CHROMA_COLLECTION_NAME to the collection"
+                    f" built with those models, or start a model migration to change models."
+                )
+            self.CHROMA_COLLECTION_NAME = active["collection"]
+            self.TEXT_MODEL_NAME = active["text_model"]
+            self.IMAGE_MODEL_NAME = active["image_model"]
+
+        for conflict in conflicts:
+            logger.warning(conflict)
+        return conflicts
+
+settings = Settings()
+active_index_conflicts = settings.apply_active_index()
\ No newline at end of file
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import time
 import os
@@ -11,7 +12,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.core.config import settings
 from src.api.endpoints import router as api_router
+from src.api.admin import router as admin_router
 from src.utils.logger import setup_logging
+from src.services.rag_service import rag_service
+from src.utils.profiler import request_profiler
 
 # Setup logging
 setup_logging()
@@ -47,8 +51,31 @@ async def add_process_time_header(request: Request, call_next):
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
+# Profiling middleware (sampled or flagged requests, see /admin/profiling)
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    if not request_profiler.should_profile(request.headers):
+        return await call_next(request)
+
+    profile = request_profiler.start(request.method, request.url.path)
+    status_code = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        await request_profiler.finish(profile, status_code)
+    response.headers["X-Profile-Id"] = profile.profile_id
+    return response
+
 # Include routers
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(admin_router, prefix=f"{settings.API_V1_STR}/admin")
+
+@app.on_event("startup")
+async def load_image_hashes():
+    if settings.PHASH_DEDUP_ENABLED:
+        # Runs in the background so startup does not wait on a full index scan
+        app.state.image_hash_task = asyncio.create_task(rag_service.load_image_hashes())
 
 @app.get("/")
 async def root():
@@ -1,27 +1,58 @@
+import asyncio
 import logging
+from collections import Counter
 import numpy as np
 from typing import List, Optional, Dict, Any
 from src.core.config import settings
 from src.models.schemas import MediaType
-from .image_processor import image_processor
-from .text_processor import text_processor
+from .image_processor import image_processor as default_image_processor
+from .phash_index import phash_index
+from .text_processor import text_processor as default_text_processor
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, text_processor=None, image_processor=None):
         self.embedding_dim = settings.EMBEDDING_DIM
+        self.text_processor = text_processor or default_text_processor
+        self.image_processor = image_processor or default_image_processor
+        # Calls in progress per model pair, so retired models are not freed under them
+        self._in_flight: Counter = Counter()
         logger.info("Embedding service initialized")
 
+    @property
+    def model_used(self) -> str:
+        return f"{self.text_processor.model_name}+{self.image_processor.model_name}"
+
+    def use_processors(self, text_processor, image_processor) -> None:
+        """Switch to other models; in-flight calls finish on the models they started with"""
+        self.text_processor, self.image_processor = text_processor, image_processor
+        logger.info(f"Embedding service now using {self.model_used}")
+
+    async def wait_idle(self, model_used: str) -> None:
+        """Wait until no call started on the `model_used` models is still running"""
+        while self._in_flight[model_used]:
+            await asyncio.sleep(0.1)
+
     async def generate_embedding(
         self, 
         text: Optional[str] = None, 
-        image_path: Optional[str] = None
+        image_path: Optional[str] = None,
+        cache_image: bool = False
     ) -> Dict[str, Any]:
-        """Generate embeddings for text, image, or both"""
+        """Generate embeddings for text, image, or both
+
+        `cache_image` keeps the image embedding for reuse by near-duplicate
+        uploads; set it when ingesting, not for queries.
+        """
+        text_processor, image_processor = self.text_processor, self.image_processor
+        model_used = f"{text_processor.model_name}+{image_processor.model_name}"
+        self._in_flight[model_used] += 1
         try:
             text_embedding = None
             image_embedding = None
+            image_hash = None
+            duplicate_of = []
             media_type = None
 
             # Process text
@@ -31,7 +62,9 @@ class EmbeddingService:
 
             # Process image
             if image_path:
-                image_embedding = await image_processor.extract_embeddings(image_path)
+                image_embedding, image_hash = await image_processor.extract_embeddings_with_hash(image_path, cache=cache_image)
+                if image_hash is not None and settings.PHASH_DEDUP_ENABLED:
+                    duplicate_of = phash_index.find_documents(image_hash, settings.PHASH_MAX_DISTANCE)
                 if media_type:
                     media_type = MediaType.MULTIMODAL
                 else:
@@ -53,13 +86,17 @@ class EmbeddingService:
             return {
                 "embedding": final_embedding,
                 "media_type": media_type,
-                "model_used": f"{settings.TEXT_MODEL_NAME}+{settings.IMAGE_MODEL_NAME}",
-                "dimensions": len(final_embedding)
+                "model_used": model_used,
+                "dimensions": len(final_embedding),
+                "image_hash": f"{image_hash:016x}" if image_hash is not None else None,
+                "duplicate_of": duplicate_of
             }
 
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
+        finally:
+            self._in_flight[model_used] -= 1
 
     async def batch_generate_embeddings(
         self, 
@@ -9,24 +9,27 @@ from typing import List, Optional, Tuple
 from transformers import ViTImageProcessor, ViTModel
 import torch
 from src.core.config import settings
+from src.utils.profiler import torch_section
+from .phash_index import compute_phash, phash_index
 
 logger = logging.getLogger(__name__)
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or settings.IMAGE_MODEL_NAME
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"Using device: {self.device}")
         
         # Load processor and model
-        self.processor = ViTImageProcessor.from_pretrained(settings.IMAGE_MODEL_NAME)
-        self.model = ViTModel.from_pretrained(settings.IMAGE_MODEL_NAME)
+        self.processor = ViTImageProcessor.from_pretrained(self.model_name)
+        self.model = ViTModel.from_pretrained(self.model_name)
         self.model.to(self.device)
         self.model.eval()
         
-        logger.info(f"Image processor initialized with model: {settings.IMAGE_MODEL_NAME}")
+        logger.info(f"Image processor initialized with model: {self.model_name}")
 
     async def load_image(self, image_path: str) -> Optional[Image.Image]:
-        """Load and validate image"""
+        """Load and validate image, storing its perceptual hash in `image.info["phash"]`"""
         try:
             async with aiofiles.open(image_path, 'rb') as file:
                 image_data = await file.read()
@@ -34,6 +37,7 @@ class ImageProcessor:
             image = Image.open(io.BytesIO(image_data))
             if image.mode != 'RGB':
                 image = image.convert('RGB')
+            image.info["phash"] = compute_phash(image)
             return image
         except Exception as e:
             logger.error(f"Error loading image {image_path}: {str(e)}")
@@ -50,26 +54,50 @@ class ImageProcessor:
 
     async def extract_embeddings(self, image_path: str) -> Optional[np.ndarray]:
         """Extract embeddings from image using Vision Transformer"""
+        embedding, _ = await self.extract_embeddings_with_hash(image_path)
+        return embedding
+
+    async def extract_embeddings_with_hash(
+        self,
+        image_path: str,
+        cache: bool = False
+    ) -> Tuple[Optional[np.ndarray], Optional[int]]:
+        """Extract embeddings and perceptual hash, reusing the embedding of a near-duplicate image
+
+        With `cache`, a computed embedding is kept for later near-duplicates;
+        only ingested images should be cached, not one-off query images.
+        """
         try:
             image = await self.load_image(image_path)
             if image is None:
-                return None
+                return None, None
+
+            image_hash = image.info.get("phash")
+            if settings.PHASH_DEDUP_ENABLED and image_hash is not None:
+                cached = phash_index.find_embedding(self.model_name, image_hash, settings.PHASH_MAX_DISTANCE)
+                if cached is not None:
+                    logger.info(f"Reusing embedding of near-duplicate image for {image_path}")
+                    return cached, image_hash
 
             # Preprocess
             inputs = self.preprocess_image(image)
             
             # Extract features
-            with torch.no_grad():
+            with torch.no_grad(), torch_section("image_processor.forward"):
                 outputs = self.model(**inputs)
                 embeddings = outputs.last_hidden_state[:, 0, :].cpu().numpy()
             
             # Normalize embeddings
             embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-            return embeddings[0]  # Return first (and only) embedding
+            embedding = embeddings[0]  # First (and only) embedding
+
+            if cache and settings.PHASH_DEDUP_ENABLED and image_hash is not None:
+                phash_index.add_embedding(self.model_name, image_hash, embedding)
+            return embedding, image_hash
         
         except Exception as e:
             logger.error(f"Error extracting embeddings from {image_path}: {str(e)}")
-            return None
+            return None, None
 
     async def extract_features_batch(self, image_paths: List[str]) -> List[Optional[np.ndarray]]:
         """Process multiple images in batch"""
@@ -79,6 +107,14 @@ class ImageProcessor:
             embeddings.append(embedding)
         return embeddings
 
+    def release(self) -> None:
+        """Free the model weights once this processor is no longer in use"""
+        self.model = None
+        self.processor = None
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"Released image model: {self.model_name}")
+
     def image_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Calculate cosine similarity between two image embeddings"""
         return float(np.dot(embedding1, embedding2))
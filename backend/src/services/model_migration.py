@@ -0,0 +1,303 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from src.core.config import settings
+from src.models.schemas import MediaType
+from .embedding_service import EmbeddingService, embedding_service
+from .image_processor import ImageProcessor
+from .rag_service import rag_service
+from .text_processor import TextProcessor
+from .vector_shards import ShardedIndex, build_index
+
+logger = logging.getLogger(__name__)
+
+class ModelMigration:
+    """Re-embed the corpus with new models into a shadow index, then switch over
+
+    The new models are loaded next to the current ones and every stored
+    document is re-embedded from its text and saved image (metadata
+    `image_path`) at no more than `max_docs_per_second`, off the event loop.
+    Search keeps using the current index until the shadow index has caught
+    up. The switch then swaps models and index together. Writes that were
+    still in flight on the old models land in the retired index and are
+    copied by a final catch-up pass.
+
+    Documents that cannot be re-embedded (source image gone, encoder error)
+    would drop out of the served index, so the migration stops before the
+    switch, in state "blocked", unless it was started with `force`. Losses
+    accepted by `force` or found by the final catch-up, when switching back
+    is no longer possible, end the migration in "completed_with_losses".
+    """
+
+    def __init__(
+        self,
+        text_model_name: str,
+        image_model_name: str,
+        max_docs_per_second: float,
+        batch_size: int,
+        force: bool = False
+    ):
+        if max_docs_per_second <= 0:
+            raise ValueError("max_docs_per_second must be positive")
+        self.migration_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        base_name = re.sub(r"_v\d+$", "", settings.CHROMA_COLLECTION_NAME)
+        self.collection_name = f"{base_name}_v{self.migration_id}"
+        self.text_model_name = text_model_name
+        self.image_model_name = image_model_name
+        self.max_docs_per_second = max_docs_per_second
+        self.batch_size = batch_size
+        self.force = force
+
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.started_at = datetime.now().isoformat()
+        self.switched_at: Optional[str] = None
+        self.total = 0
+        self.processed = 0
+        self.skipped_ids: List[str] = []
+        self.failed_ids: List[str] = []
+        self._copy_started: Optional[float] = None
+        self._next_slot = 0.0
+        self._done: Set[str] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def switched(self) -> bool:
+        return self.switched_at is not None
+
+    @property
+    def skipped(self) -> int:
+        return len(self.skipped_ids)
+
+    @property
+    def failed(self) -> int:
+        return len(self.failed_ids)
+
+    def status(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._copy_started if self._copy_started else 0.0
+        throughput = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.processed - self.skipped - self.failed, 0)
+        return {
+            "migration_id": self.migration_id,
+            "state": self.state,
+            "error": self.error,
+            "text_model": self.text_model_name,
+            "image_model": self.image_model_name,
+            "shadow_collection": self.collection_name,
+            "started_at": self.started_at,
+            "switched_at": self.switched_at,
+            "total": self.total,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "lost_ids": self.skipped_ids + self.failed_ids,
+            "force": self.force,
+            "progress": (self.total - remaining) / self.total if self.total else 0.0,
+            "docs_per_second": throughput,
+            "max_docs_per_second": self.max_docs_per_second,
+            "eta_seconds": remaining / throughput if throughput > 0 else None
+        }
+
+    async def _throttle(self) -> None:
+        """Pace re-embedding to at most `max_docs_per_second`"""
+        now = time.monotonic()
+        wait = self._next_slot - now
+        self._next_slot = max(self._next_slot, now) + 1.0 / self.max_docs_per_second
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _reembed(self, embedder: EmbeddingService, document: str, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """New-model embedding for a stored document, or None if its source is gone"""
+        media_type = metadata.get("media_type", MediaType.TEXT)
+        needs_image = media_type in (MediaType.IMAGE, MediaType.MULTIMODAL)
+        image_path = metadata.get("image_path") if needs_image else None
+        if needs_image and not (image_path and os.path.exists(image_path)):
+            return None
+
+        # Runs on its own loop in a worker thread so model inference never blocks request handling
+        embedding_data = await asyncio.to_thread(
+            asyncio.run,
+            embedder.generate_embedding(
+                text=document if media_type != MediaType.IMAGE else None,
+                image_path=image_path,
+                cache_image=True
+            )
+        )
+        if embedding_data["media_type"] != media_type:
+            return None
+        return embedding_data
+
+    async def _copy_until_caught_up(self, source: ShardedIndex, shadow: ShardedIndex, embedder: EmbeddingService) -> None:
+        """Re-embed documents of `source` not yet copied until a pass finds none"""
+        while True:
+            self.total = await source.count()
+            copied = 0
+            async for batch in source.iter_documents(exclude=self._done, batch_size=self.batch_size):
+                for doc_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                    await self._throttle()
+                    self._done.add(doc_id)
+                    copied += 1
+                    try:
+                        embedding_data = await self._reembed(embedder, document, metadata or {})
+                        if embedding_data is None:
+                            logger.warning(f"Skipping document {doc_id}: source image unavailable")
+                            self.skipped_ids.append(doc_id)
+                            continue
+                        await shadow.add(doc_id, embedding_data["embedding"], document, metadata)
+                        self.processed += 1
+                    except Exception as e:
+                        logger.error(f"Error re-embedding document {doc_id}: {str(e)}")
+                        self.failed_ids.append(doc_id)
+            if copied == 0:
+                return
+
+    async def _drop_shadow(self, shadow: Optional[ShardedIndex]) -> None:
+        """Delete a shadow index that will never be served"""
+        if shadow is None or self.switched:
+            return
+        try:
+            await shadow.drop()
+            logger.info(f"Dropped shadow collection {self.collection_name}")
+        except Exception as e:
+            logger.error(f"Error dropping shadow collection {self.collection_name}: {str(e)}")
+
+    async def run(self) -> None:
+        shadow = None
+        try:
+            self.state = "loading_models"
+            text_processor = embedding_service.text_processor
+            if self.text_model_name != text_processor.model_name:
+                text_processor = await asyncio.to_thread(TextProcessor, self.text_model_name)
+            image_processor = embedding_service.image_processor
+            if self.image_model_name != image_processor.model_name:
+                image_processor = await asyncio.to_thread(ImageProcessor, self.image_model_name)
+            embedder = EmbeddingService(text_processor, image_processor)
+
+            source = rag_service.index
+            shadow = await asyncio.to_thread(build_index, self.collection_name, False)
+
+            self.state = "copying"
+            self._copy_started = time.monotonic()
+            await self._copy_until_caught_up(source, shadow, embedder)
+
+            if (self.skipped_ids or self.failed_ids) and not self.force:
+                self.state = "blocked"
+                self.error = (
+                    f"{self.skipped + self.failed} documents could not be re-embedded and would be lost"
+                    f" (see lost_ids); start the migration with force=true to switch anyway"
+                )
+                logger.error(f"Model migration {self.migration_id} blocked: {self.error}")
+                await self._drop_shadow(shadow)
+                return
+
+            # Models and index switch in one step, with no await in between
+            retired_processors = [
+                processor
+                for processor in (embedding_service.text_processor, embedding_service.image_processor)
+                if processor not in (text_processor, image_processor)
+            ]
+            embedding_service.use_processors(text_processor, image_processor)
+            rag_service.switch_index(shadow, embedder.model_used, retired_processors)
+            settings.CHROMA_COLLECTION_NAME = self.collection_name
+            settings.TEXT_MODEL_NAME = self.text_model_name
+            settings.IMAGE_MODEL_NAME = self.image_model_name
+            self.switched_at = datetime.now().isoformat()
+            await asyncio.to_thread(self._write_active_index)
+
+            self.state = "draining"
+            await asyncio.sleep(settings.MIGRATION_SWITCH_GRACE_SECONDS)
+            await self._copy_until_caught_up(source, shadow, embedder)
+            await rag_service.drop_retired_index()
+
+            lost_ids = self.skipped_ids + self.failed_ids
+            if lost_ids:
+                self.state = "completed_with_losses"
+                logger.error(
+                    f"Model migration {self.migration_id} completed without {len(lost_ids)} documents"
+                    f" that could not be re-embedded: {', '.join(lost_ids)}"
+                )
+            else:
+                self.state = "completed"
+            logger.info(f"Model migration {self.migration_id} {self.state}: {self.status()}")
+
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            logger.info(f"Model migration {self.migration_id} cancelled")
+            await self._drop_shadow(shadow)
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Model migration {self.migration_id} failed: {str(e)}")
+            await self._drop_shadow(shadow)
+
+    def _write_active_index(self) -> None:
+        """Persist the switch so restarts load the new collection and models"""
+        os.makedirs(os.path.dirname(settings.ACTIVE_INDEX_FILE) or ".", exist_ok=True)
+        tmp_path = f"{settings.ACTIVE_INDEX_FILE}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({
+                "collection": self.collection_name,
+                "text_model": self.text_model_name,
+                "image_model": self.image_model_name,
+                "switched_at": self.switched_at
+            }, file, indent=2)
+        os.replace(tmp_path, settings.ACTIVE_INDEX_FILE)
+
+class MigrationManager:
+    """Runs at most one model migration at a time"""
+
+    def __init__(self):
+        self.current: Optional[ModelMigration] = None
+
+    @property
+    def running(self) -> bool:
+        return self.current is not None and self.current.task is not None and not self.current.task.done()
+
+    def start(
+        self,
+        text_model_name: Optional[str] = None,
+        image_model_name: Optional[str] = None,
+        max_docs_per_second: Optional[float] = None,
+        force: bool = False
+    ) -> ModelMigration:
+        if self.running:
+            raise RuntimeError("A model migration is already running")
+
+        text_model_name = text_model_name or embedding_service.text_processor.model_name
+        image_model_name = image_model_name or embedding_service.image_processor.model_name
+        if (text_model_name, image_model_name) == (
+            embedding_service.text_processor.model_name,
+            embedding_service.image_processor.model_name
+        ):
+            raise ValueError("The requested models are already active")
+
+        migration = ModelMigration(
+            text_model_name=text_model_name,
+            image_model_name=image_model_name,
+            max_docs_per_second=max_docs_per_second or settings.MIGRATION_MAX_DOCS_PER_SECOND,
+            batch_size=settings.MIGRATION_BATCH_SIZE,
+            force=force
+        )
+        # Fresh context so the long-running task never inherits the starting request's profile
+        migration.task = asyncio.create_task(migration.run(), context=contextvars.Context())
+        self.current = migration
+        logger.info(f"Started model migration {migration.migration_id} to {text_model_name}+{image_model_name}")
+        return migration
+
+    def cancel(self) -> ModelMigration:
+        if not self.running:
+            raise RuntimeError("No model migration is running")
+        if self.current.switched:
+            raise RuntimeError("Migration has already switched over and is finishing its catch-up")
+        self.current.task.cancel()
+        return self.current
+
+# Singleton instance
+migration_manager = MigrationManager()
@@ -0,0 +1,136 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def compute_phash(image: Image.Image) -> int:
+    """64-bit DCT perceptual hash, stable under resizing and recompression"""
+    gray = np.asarray(image.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.float32)
+    low_freq = cv2.dct(gray)[:8, :8].flatten()
+    # Skip the DC term so overall brightness does not dominate the median
+    bits = low_freq > np.median(low_freq[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    return (hash1 ^ hash2).bit_count()
+
+class _Node:
+    __slots__ = ("hash", "doc_ids", "children")
+
+    def __init__(self, image_hash: int):
+        self.hash = image_hash
+        self.doc_ids: List[str] = []
+        self.children: Dict[int, "_Node"] = {}
+
+class _BKTree:
+    """BK-tree over 64-bit hashes under Hamming distance"""
+
+    def __init__(self):
+        self.root: Optional[_Node] = None
+        self.nodes: Dict[int, _Node] = {}
+
+    def insert(self, image_hash: int) -> _Node:
+        node = self.nodes.get(image_hash)
+        if node is not None:
+            return node
+
+        node = _Node(image_hash)
+        self.nodes[image_hash] = node
+        if self.root is None:
+            self.root = node
+            return node
+
+        current = self.root
+        while True:
+            distance = hamming_distance(image_hash, current.hash)
+            child = current.children.get(distance)
+            if child is None:
+                current.children[distance] = node
+                return node
+            current = child
+
+    def search(self, image_hash: int, max_distance: int) -> List[Tuple[int, _Node]]:
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(image_hash, node.hash)
+            if distance <= max_distance:
+                matches.append((distance, node))
+            # Triangle inequality: only subtrees within the radius can match
+            for child_distance, child in node.children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+class PerceptualHashIndex:
+    """Hamming-radius lookups of stored documents and cached embeddings by image hash
+
+    Hashes of stored documents live in one BK-tree, so near-duplicate
+    images can be flagged at ingest. Embeddings computed for ingested
+    images live in a bounded LRU cache, keyed by image model, with a
+    second tree over the cached hashes so a near-duplicate can skip the
+    forward pass. BK-trees cannot delete, so the cache tree is rebuilt
+    from the live entries once evictions leave it twice the cache size.
+    """
+
+    def __init__(self, cache_size: int = 10000):
+        self.cache_size = cache_size
+        self._documents = _BKTree()
+        self._cached = _BKTree()
+        self._embeddings: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_embedding(self, model_name: str, image_hash: int, embedding: np.ndarray) -> None:
+        key = (model_name, image_hash)
+        with self._lock:
+            self._cached.insert(image_hash)
+            self._embeddings[key] = embedding
+            self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.cache_size:
+                self._embeddings.popitem(last=False)
+            if len(self._cached) > 2 * self.cache_size:
+                self._cached = _BKTree()
+                for _, cached_hash in self._embeddings:
+                    self._cached.insert(cached_hash)
+
+    def add_document(self, image_hash: int, doc_id: str) -> None:
+        with self._lock:
+            node = self._documents.insert(image_hash)
+            if doc_id not in node.doc_ids:
+                node.doc_ids.append(doc_id)
+
+    def find_embedding(self, model_name: str, image_hash: int, max_distance: int) -> Optional[np.ndarray]:
+        """Cached `model_name` embedding of the nearest image within `max_distance`"""
+        with self._lock:
+            for _, node in self._cached.search(image_hash, max_distance):
+                key = (model_name, node.hash)
+                embedding = self._embeddings.get(key)
+                if embedding is not None:
+                    self._embeddings.move_to_end(key)
+                    return embedding
+        return None
+
+    def find_documents(self, image_hash: int, max_distance: int) -> List[str]:
+        """Ids of stored documents whose image is within `max_distance`, nearest first"""
+        with self._lock:
+            return [
+                doc_id
+                for _, node in self._documents.search(image_hash, max_distance)
+                for doc_id in node.doc_ids
+            ]
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+# Singleton instance
+phash_index = PerceptualHashIndex(cache_size=settings.PHASH_CACHE_SIZE)
@@ -1,40 +1,75 @@
 import logging
-import chromadb
 import numpy as np
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
-from src.core.config import settings
 from src.models.schemas import MediaType, SearchResult
 from .embedding_service import embedding_service
-from .text_processor import text_processor
+from .phash_index import phash_index
+from .vector_shards import build_index
 
 logger = logging.getLogger(__name__)
 
+class StaleEmbeddingError(RuntimeError):
+    """Embedding produced by models whose index is no longer kept"""
+
 class HybridRAGService:
     def __init__(self):
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
-        self.collection = self._get_or_create_collection()
+        self.index = build_index()
+        self.model_used = embedding_service.model_used
+        # Previous index while a model switch-over drains in-flight requests
+        self.retired_index = None
+        self.retired_model_used = None
+        self.retired_processors = []
         logger.info("Hybrid RAG service initialized")
 
-    def _get_or_create_collection(self) -> chromadb.Collection:
-        """Get or create ChromaDB collection"""
-        try:
-            return self.client.get_collection("multimodal_rag")
-        except:
-            return self.client.create_collection(
-                name="multimodal_rag",
-                metadata={"description": "Multimodal RAG collection"}
-            )
+    def serves(self, model_used: str) -> bool:
+        """Whether an index for embeddings from `model_used` is kept"""
+        return model_used is not None and model_used in (self.model_used, self.retired_model_used)
+
+    def _index_for(self, model_used: Optional[str]):
+        """Index holding vectors produced by `model_used` (None: the current models)
+
+        Raises StaleEmbeddingError for any other models, e.g. a write that
+        was still embedding on the old models when the retired index was
+        dropped; storing it in the current index would mix embedding spaces.
+        """
+        if model_used is None or model_used == self.model_used:
+            return self.index
+        if model_used == self.retired_model_used:
+            return self.retired_index
+        raise StaleEmbeddingError(f"No index is kept for embeddings from {model_used}; embed again with {self.model_used}")
+
+    def switch_index(self, index, model_used: str, retired_processors: Optional[List[Any]] = None) -> None:
+        """Atomically serve from `index`, keeping the current one as retired
+
+        `retired_processors` are the old-model processors still needed by
+        in-flight requests; they are released by `drop_retired_index`.
+        """
+        self.retired_index, self.retired_model_used = self.index, self.model_used
+        self.retired_processors = retired_processors or []
+        self.index, self.model_used = index, model_used
+        logger.info(f"Switched vector index to models {model_used}")
+
+    async def drop_retired_index(self) -> None:
+        """Forget the retired index, then free the retired models once no call is using them"""
+        model_used, processors = self.retired_model_used, self.retired_processors
+        self.retired_index, self.retired_model_used = None, None
+        self.retired_processors = []
+        if model_used:
+            await embedding_service.wait_idle(model_used)
+        for processor in processors:
+            processor.release()
 
     async def add_document(
         self,
         content: str,
         media_type: MediaType,
         embedding: List[float],
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        model_used: Optional[str] = None
     ) -> str:
-        """Add document to vector store"""
+        """Add document to the index matching the models that produced `embedding`"""
         try:
             doc_id = str(uuid.uuid4())
             
@@ -47,13 +82,16 @@ class HybridRAGService:
             if metadata:
                 default_metadata.update(metadata)
 
-            self.collection.add(
-                documents=[content],
-                embeddings=[embedding],
-                metadatas=[default_metadata],
-                ids=[doc_id]
+            await self._index_for(model_used).add(
+                doc_id=doc_id,
+                embedding=embedding,
+                document=content,
+                metadata=default_metadata
             )
             
+            if default_metadata.get("image_hash"):
+                phash_index.add_document(int(default_metadata["image_hash"], 16), doc_id)
+
             logger.info(f"Added document {doc_id} to vector store")
             return doc_id
             
@@ -61,6 +99,20 @@ class HybridRAGService:
             logger.error(f"Error adding document: {str(e)}")
             raise
 
+    async def load_image_hashes(self) -> int:
+        """Rebuild the near-duplicate index from image hashes stored in metadata"""
+        loaded = 0
+        try:
+            async for batch in self.index.iter_documents(include=["metadatas"]):
+                for doc_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                    if metadata and metadata.get("image_hash"):
+                        phash_index.add_document(int(metadata["image_hash"], 16), doc_id)
+                        loaded += 1
+        except Exception as e:
+            logger.error(f"Error loading image hashes: {str(e)}")
+        logger.info(f"Loaded {loaded} image hashes into the near-duplicate index")
+        return loaded
+
     async def hybrid_search(
         self,
         query_text: Optional[str] = None,
@@ -74,28 +126,28 @@ class HybridRAGService:
                 text=query_text,
                 image_path=query_image_path
             )
+            if not self.serves(embedding_data["model_used"]):
+                # Models switched over and the old index was dropped meanwhile
+                embedding_data = await embedding_service.generate_embedding(
+                    text=query_text,
+                    image_path=query_image_path
+                )
             query_embedding = embedding_data["embedding"]
 
-            # Search in vector store
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["metadatas", "documents", "distances"]
-            )
+            # Search in vector store (scatter-gather across shards)
+            index = self._index_for(embedding_data["model_used"])
+            hits = await index.query(query_embedding, top_k)
 
             # Convert to SearchResult objects
             search_results = []
-            for i, (doc, metadata, distance) in enumerate(zip(
-                results['documents'][0],
-                results['metadatas'][0],
-                results['distances'][0]
-            )):
+            for hit in hits:
+                metadata = hit["metadata"]
                 # Convert distance to similarity score
-                similarity_score = 1 - (distance / 2)  # Chroma uses L2 distance
+                similarity_score = 1 - (hit["distance"] / 2)  # Chroma uses L2 distance
                 
                 search_results.append(SearchResult(
-                    id=results['ids'][0][i],
-                    content=doc,
+                    id=hit["id"],
+                    content=hit["document"],
                     media_type=metadata.get('media_type', MediaType.TEXT),
                     similarity_score=similarity_score,
                     metadata=metadata
@@ -0,0 +1,405 @@
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Set, Tuple
+import numpy as np
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# File layout (little endian):
+#   header (HEADER_SIZE bytes, see HEADER_FORMAT)
+#   vectors        float32[count, dim]
+#   squared norms  float32[count]
+#   record index   uint64[count + 1]   byte offsets into the records section
+#   records        UTF-8 JSON {"id", "document", "metadata"} per document
+#   ids            UTF-8 document ids separated by newlines, in vector order
+#   info           UTF-8 JSON (creation time, collection, models)
+SNAPSHOT_MAGIC = b"MMSNAP\0\0"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_SUFFIX = ".mmsnap"
+HEADER_FORMAT = "<8sHHIQQQQQQQQQQQ"
+HEADER_SIZE = 128
+_SNAPSHOT_NAME = re.compile(r"^snapshot-(\d{6})\.mmsnap$")
+
+def snapshot_name(sequence: int) -> str:
+    return f"snapshot-{sequence:06d}{SNAPSHOT_SUFFIX}"
+
+def current_models() -> Dict[str, str]:
+    """Models whose vectors the active index holds"""
+    return {"text_model": settings.TEXT_MODEL_NAME, "image_model": settings.IMAGE_MODEL_NAME}
+
+def _same_models(info: Dict[str, Any]) -> bool:
+    return all(info.get(key) == value for key, value in current_models().items())
+
+class SnapshotReader:
+    """Memory-mapped view of one snapshot file
+
+    Vectors and norms are numpy views over the mapping, so opening a
+    snapshot costs only the header parse; records are decoded on demand
+    and ids are looked up through a position map built on first use.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic, version, _, self.dim, self.count, self.sequence, self.parent_sequence,
+            vectors_offset, norms_offset, index_offset, records_offset,
+            ids_offset, ids_length, info_offset, info_length
+        ) = struct.unpack_from(HEADER_FORMAT, self._mmap, 0)
+
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{self.path} is not an index snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} in {self.path}")
+
+        self.vectors = np.frombuffer(self._mmap, dtype=np.float32, count=self.count * self.dim, offset=vectors_offset)
+        self.vectors = self.vectors.reshape(self.count, self.dim)
+        self.norms = np.frombuffer(self._mmap, dtype=np.float32, count=self.count, offset=norms_offset)
+        self._record_index = np.frombuffer(self._mmap, dtype=np.uint64, count=self.count + 1, offset=index_offset)
+        self._records_offset = records_offset
+        self._ids_range = (ids_offset, ids_offset + ids_length)
+        self._ids: Optional[List[str]] = None
+        self._positions: Optional[Dict[str, int]] = None
+        self.info = json.loads(self._mmap[info_offset:info_offset + info_length])
+
+    def record(self, position: int) -> Dict[str, Any]:
+        start = self._records_offset + int(self._record_index[position])
+        end = self._records_offset + int(self._record_index[position + 1])
+        return json.loads(self._mmap[start:end])
+
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            start, end = self._ids_range
+            self._ids = self._mmap[start:end].decode().split("\n") if self.count else []
+        return self._ids
+
+    def position(self, doc_id: str) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {doc_id: position for position, doc_id in enumerate(self.ids())}
+        return self._positions.get(doc_id)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.path.name,
+            "sequence": self.sequence,
+            "parent_sequence": self.parent_sequence,
+            "count": self.count,
+            "dimensions": self.dim,
+            "size_bytes": self.path.stat().st_size,
+            **self.info
+        }
+
+class SnapshotWriter:
+    """Streams documents (shard `get` batches) into a new snapshot file
+
+    Vectors are written in place while records and ids are spooled to
+    temporary files, so memory stays bounded by one batch; `finish`
+    appends the remaining sections, writes the header last and moves the
+    file into place.
+    """
+
+    def __init__(self, path: Path, sequence: int, parent_sequence: int, info: Dict[str, Any]):
+        self.path = path
+        self.sequence = sequence
+        self.parent_sequence = parent_sequence
+        self.info = info
+        self.count = 0
+        self.dim: Optional[int] = None
+        self._tmp_path = path.with_suffix(".tmp")
+        self._file = open(self._tmp_path, "wb")
+        self._file.seek(HEADER_SIZE)
+        self._records = tempfile.TemporaryFile()
+        self._ids = tempfile.TemporaryFile()
+        self._norms: List[np.ndarray] = []
+        self._record_index = array("Q", [0])
+
+    def write(self, batch: Dict[str, Any]) -> None:
+        if not batch["ids"]:
+            return
+        vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Mixed embedding dimensions in snapshot: {self.dim} and {vectors.shape[1]}")
+
+        self._file.write(vectors.tobytes())
+        self._norms.append(np.einsum("ij,ij->i", vectors, vectors))
+        for doc_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            self._records.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}).encode())
+            self._record_index.append(self._records.tell())
+        self._ids.write((("\n" if self.count else "") + "\n".join(batch["ids"])).encode())
+        self.count += len(batch["ids"])
+
+    def finish(self) -> int:
+        """Complete the file and atomically move it to `path`, returning the document count"""
+        file = self._file
+        dim = self.dim or 0
+        vectors_offset = HEADER_SIZE
+        norms_offset = file.tell()
+        file.write(np.concatenate(self._norms).astype(np.float32).tobytes() if self._norms else b"")
+        index_offset = file.tell()
+        file.write(self._record_index.tobytes())
+        records_offset = file.tell()
+        self._records.seek(0)
+        shutil.copyfileobj(self._records, file)
+
+        ids_offset = file.tell()
+        self._ids.seek(0)
+        shutil.copyfileobj(self._ids, file)
+        ids_length = file.tell() - ids_offset
+
+        info_offset = file.tell()
+        info_bytes = json.dumps(self.info).encode()
+        file.write(info_bytes)
+
+        file.seek(0)
+        file.write(struct.pack(
+            HEADER_FORMAT, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, dim, self.count, self.sequence, self.parent_sequence,
+            vectors_offset, norms_offset, index_offset, records_offset,
+            ids_offset, ids_length, info_offset, len(info_bytes)
+        ))
+        file.flush()
+        os.fsync(file.fileno())
+        self._close()
+        os.replace(self._tmp_path, self.path)
+        return self.count
+
+    def discard(self) -> None:
+        """Drop the partially written file"""
+        self._close()
+        if self._tmp_path.exists():
+            self._tmp_path.unlink()
+
+    def _close(self) -> None:
+        for file in (self._file, self._records, self._ids):
+            file.close()
+
+class SnapshotStore:
+    """Directory of chained snapshots: one full base plus incremental deltas
+
+    Each snapshot holds only documents absent from its predecessors, so
+    replicas fetch the newest files they are missing and load them next to
+    the ones they already have. A new base (parent sequence 0) starts
+    whenever the collection or models differ from the previous snapshot,
+    so a chain never mixes vectors from different models. Deletions are
+    not tracked since the index has no delete path.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        # Serializes sequence allocation and writing of new snapshots
+        self._create_lock = asyncio.Lock()
+
+    def paths(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        return sorted(path for path in self.directory.iterdir() if _SNAPSHOT_NAME.match(path.name))
+
+    def readers(self) -> List[SnapshotReader]:
+        return [SnapshotReader(path) for path in self.paths()]
+
+    def walk_chain(self) -> Tuple[List[SnapshotReader], Optional[Dict[str, int]]]:
+        """Latest base snapshot and the deltas linked to it, plus the first broken link
+
+        Each delta must name the previous file as its parent; a missing
+        file (e.g. a replica that skipped one) ends the chain there, since
+        serving the deltas after it would silently drop documents.
+        """
+        readers = self.readers()
+        bases = [i for i, reader in enumerate(readers) if reader.parent_sequence == 0]
+        if not bases:
+            return [], None
+
+        chain = [readers[bases[-1]]]
+        for reader in readers[bases[-1] + 1:]:
+            if reader.parent_sequence != chain[-1].sequence:
+                return chain, {
+                    "after_sequence": chain[-1].sequence,
+                    "next_sequence": reader.sequence,
+                    "missing_parent_sequence": reader.parent_sequence
+                }
+            chain.append(reader)
+        return chain, None
+
+    def chain(self) -> List[SnapshotReader]:
+        return self.walk_chain()[0]
+
+    def chain_gap(self) -> Optional[Dict[str, int]]:
+        return self.walk_chain()[1]
+
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        return [reader.describe() for reader in self.readers()]
+
+    def get_path(self, name: str) -> Optional[Path]:
+        path = self.directory / name
+        if not _SNAPSHOT_NAME.match(name) or not path.is_file():
+            return None
+        return path
+
+    async def create(self, index) -> Optional[Dict[str, Any]]:
+        """Export documents added to `index` since the last snapshot
+
+        Returns the new snapshot's description, or None when there is no delta.
+        """
+        async with self._create_lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            paths = self.paths()
+            last_sequence = int(_SNAPSHOT_NAME.match(paths[-1].name).group(1)) if paths else 0
+            chain = await asyncio.to_thread(self.chain)
+            info = {
+                "created_at": datetime.now().isoformat(),
+                "collection": settings.CHROMA_COLLECTION_NAME,
+                **current_models()
+            }
+            if chain and (chain[-1].info.get("collection") != info["collection"] or not _same_models(chain[-1].info)):
+                logger.info("Collection or models changed since the last snapshot; starting a new base snapshot")
+                chain = []
+
+            known: Set[str] = set()
+            for reader in chain:
+                known.update(await asyncio.to_thread(reader.ids))
+
+            parent_sequence = chain[-1].sequence if chain else 0
+            sequence = last_sequence + 1
+            path = self.directory / snapshot_name(sequence)
+            writer = await asyncio.to_thread(SnapshotWriter, path, sequence, parent_sequence, info)
+            try:
+                async for batch in index.iter_documents(exclude=known):
+                    await asyncio.to_thread(writer.write, batch)
+                if writer.count == 0:
+                    writer.discard()
+                    logger.info("No new documents since the last snapshot")
+                    return None
+                count = await asyncio.to_thread(writer.finish)
+            except BaseException:
+                writer.discard()
+                raise
+
+        logger.info(f"Wrote snapshot {path.name} with {count} documents")
+        return SnapshotReader(path).describe()
+
+class SnapshotShard:
+    """Read-only shard serving queries straight from mmapped snapshots
+
+    Only the latest snapshot chain is served, and only if it was produced
+    by the models currently configured; vectors from other models are not
+    comparable with query embeddings even when dimensions happen to match.
+    """
+
+    def __init__(self, directory: str):
+        self.name = f"snapshot:{directory}"
+        self.store = SnapshotStore(directory)
+        self._lock = threading.Lock()
+        self.readers: List[SnapshotReader] = []
+        self.gap: Optional[Dict[str, int]] = None
+        self.reload()
+
+    def reload(self) -> int:
+        """Map the current snapshot chain, returning how many files are newly loaded"""
+        with self._lock:
+            loaded = {reader.path: reader for reader in self.readers}
+            chain, self.gap = self.store.walk_chain()
+            readers = []
+            for reader in chain:
+                if not _same_models(reader.info):
+                    logger.warning(
+                        f"Ignoring snapshot {reader.path.name}: built with"
+                        f" {reader.info.get('text_model')}+{reader.info.get('image_model')},"
+                        f" active models are {settings.TEXT_MODEL_NAME}+{settings.IMAGE_MODEL_NAME}"
+                    )
+                    continue
+                readers.append(loaded.get(reader.path, reader))
+            new_count = sum(1 for reader in readers if reader.path not in loaded)
+            self.readers = readers
+        if self.gap:
+            logger.error(
+                f"Snapshot chain in {self.store.directory} stops at sequence {self.gap['after_sequence']}:"
+                f" snapshot {self.gap['next_sequence']} needs missing snapshot {self.gap['missing_parent_sequence']}"
+            )
+        if new_count:
+            logger.info(f"Loaded {new_count} snapshot(s) from {self.store.directory}")
+        return new_count
+
+    def add(self, *args) -> None:
+        raise RuntimeError("Snapshot shards are read-only")
+
+    def query(self, embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """Top-k by squared L2 distance, matching Chroma's default space"""
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm = float(query @ query)
+
+        candidates = []
+        for reader in self.readers:
+            if reader.count == 0 or reader.dim != len(query):
+                continue
+            distances = reader.norms - 2 * (reader.vectors @ query) + query_norm
+            k = min(top_k, reader.count)
+            top = np.argpartition(distances, k - 1)[:k]
+            candidates.extend((float(distances[position]), reader, int(position)) for position in top)
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        hits = []
+        for distance, reader, position in candidates[:top_k]:
+            record = reader.record(position)
+            hits.append({
+                "id": record["id"],
+                "document": record["document"],
+                "metadata": record["metadata"],
+                "distance": max(distance, 0.0)
+            })
+        return hits
+
+    def count(self) -> int:
+        return sum(reader.count for reader in self.readers)
+
+    def ids(self) -> List[str]:
+        return [doc_id for reader in self.readers for doc_id in reader.ids()]
+
+    def get(self, ids: List[str], include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include or ["embeddings", "documents", "metadatas"]
+        results = {"ids": [], **{field: [] for field in include}}
+        for doc_id in ids:
+            for reader in self.readers:
+                position = reader.position(doc_id)
+                if position is None:
+                    continue
+                results["ids"].append(doc_id)
+                if "embeddings" in include:
+                    results["embeddings"].append(reader.vectors[position].tolist())
+                if "documents" in include or "metadatas" in include:
+                    record = reader.record(position)
+                    for field, key in (("documents", "document"), ("metadatas", "metadata")):
+                        if field in include:
+                            results[field].append(record[key])
+                break
+        return results
+
+snapshot_store = SnapshotStore(settings.SNAPSHOT_DIRECTORY)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or inspect index snapshots")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("export", help="Write an incremental snapshot of the configured index")
+    subcommands.add_parser("list", help="List snapshots in SNAPSHOT_DIRECTORY")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from src.services.vector_shards import build_index
+        print(json.dumps(asyncio.run(snapshot_store.create(build_index())), indent=2))
+    else:
+        print(json.dumps(snapshot_store.list_snapshots(), indent=2))
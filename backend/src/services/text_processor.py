@@ -2,18 +2,20 @@ import logging
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import torch
-from typing import List, Union
+from typing import List, Optional, Union
 from src.core.config import settings
+from src.utils.profiler import torch_section
 
 logger = logging.getLogger(__name__)
 
 class TextProcessor:
-    def __init__(self):
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or settings.TEXT_MODEL_NAME
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = SentenceTransformer(settings.TEXT_MODEL_NAME)
+        self.model = SentenceTransformer(self.model_name)
         self.model.to(self.device)
         
-        logger.info(f"Text processor initialized with model: {settings.TEXT_MODEL_NAME}")
+        logger.info(f"Text processor initialized with model: {self.model_name}")
 
     def encode_text(self, text: Union[str, List[str]]) -> np.ndarray:
         """Encode text into embeddings"""
@@ -21,12 +23,13 @@ class TextProcessor:
             if isinstance(text, str):
                 text = [text]
             
-            embeddings = self.model.encode(
-                text, 
-                convert_to_tensor=True, 
-                device=self.device,
-                normalize_embeddings=True
-            )
+            with torch_section("text_processor.forward"):
+                embeddings = self.model.encode(
+                    text, 
+                    convert_to_tensor=True, 
+                    device=self.device,
+                    normalize_embeddings=True
+                )
             
             return embeddings.cpu().numpy()
         
@@ -34,6 +37,13 @@ class TextProcessor:
             logger.error(f"Error encoding text: {str(e)}")
             raise
 
+    def release(self) -> None:
+        """Free the model weights once this processor is no longer in use"""
+        self.model = None
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"Released text model: {self.model_name}")
+
     def semantic_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Calculate cosine similarity between two text embeddings"""
         return float(np.dot(embedding1, embedding2))
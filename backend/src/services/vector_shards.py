@@ -0,0 +1,451 @@
+import argparse
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from itertools import islice
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from typing import AsyncIterator, List, Optional, Dict, Any, Set, Tuple
+import chromadb
+from src.core.config import settings
+from .snapshot import SnapshotShard
+
+logger = logging.getLogger(__name__)
+
+Hit = Dict[str, Any]
+
+# Operations a shard server exposes to RemoteShard clients
+SHARD_OPS = {"add", "query", "count", "ids", "get", "drop"}
+
+# Fields a shard `get` can return
+GET_FIELDS = ["embeddings", "documents", "metadatas"]
+
+# Placeholder secrets that must never authenticate shard traffic
+_INSECURE_AUTHKEYS = {"", "your-secret-key-here"}
+
+class LocalShard:
+    """Shard backed by a ChromaDB collection in this process"""
+
+    def __init__(self, client: "chromadb.ClientAPI", collection_name: str):
+        self.name = collection_name
+        self.client = client
+        self.collection = client.get_or_create_collection(
+            name=collection_name,
+            metadata={"description": "Multimodal RAG collection"}
+        )
+
+    @classmethod
+    def open(cls, path: str, collection_name: str) -> "LocalShard":
+        return cls(chromadb.PersistentClient(path=path), collection_name)
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self.collection.add(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas
+        )
+
+    def query(self, embedding: List[float], top_k: int) -> List[Hit]:
+        """Top-k hits ordered by ascending distance"""
+        count = self.collection.count()
+        if count == 0:
+            return []
+
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=min(top_k, count),
+            include=["metadatas", "documents", "distances"]
+        )
+        return [
+            {"id": doc_id, "document": doc, "metadata": metadata, "distance": distance}
+            for doc_id, doc, metadata, distance in zip(
+                results['ids'][0],
+                results['documents'][0],
+                results['metadatas'][0],
+                results['distances'][0]
+            )
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def ids(self) -> List[str]:
+        return self.collection.get(include=[])['ids']
+
+    def drop(self) -> None:
+        """Delete the collection with all its documents"""
+        self.client.delete_collection(self.name)
+
+    def get(self, ids: List[str], include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Stored fields (`include`, default all of GET_FIELDS) for `ids`"""
+        include = include or GET_FIELDS
+        results = self.collection.get(ids=ids, include=include)
+        fetched = {"ids": results['ids']}
+        for field in include:
+            fetched[field] = results[field]
+        if "embeddings" in include:
+            fetched["embeddings"] = [list(map(float, embedding)) for embedding in results['embeddings']]
+        return fetched
+
+class RemoteShard:
+    """Client for a shard served by `serve_shard` in another process or host"""
+
+    def __init__(self, address: Tuple[str, int], collection_name: str, timeout: float = 10.0, authkey: Optional[bytes] = None):
+        self.address = address
+        self.name = collection_name
+        self.timeout = timeout
+        self.authkey = authkey or _authkey()
+        self._idle: "queue.SimpleQueue[Connection]" = queue.SimpleQueue()
+
+    def _connect(self) -> Connection:
+        """Open an authenticated connection, bounding the TCP connect by `timeout`"""
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.settimeout(None)
+        conn = Connection(sock.detach())
+        try:
+            # The server speaks first; do not block on a peer that never answers
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Shard {self.address} did not start the handshake within {self.timeout}s")
+            answer_challenge(conn, self.authkey)
+            deliver_challenge(conn, self.authkey)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _call(self, op: str, *args):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            _send_json(conn, [op, self.name, list(args)])
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Shard {self.address} did not answer {op} within {self.timeout}s")
+            status, result = _recv_json(conn)
+        except Exception:
+            conn.close()
+            raise
+
+        self._idle.put(conn)
+        if status != "ok":
+            raise RuntimeError(f"Shard {self.address} failed {op}: {result}")
+        return result
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self._call("add", ids, embeddings, documents, metadatas)
+
+    def query(self, embedding: List[float], top_k: int) -> List[Hit]:
+        return self._call("query", embedding, top_k)
+
+    def count(self) -> int:
+        return self._call("count")
+
+    def ids(self) -> List[str]:
+        return self._call("ids")
+
+    def drop(self) -> None:
+        self._call("drop")
+
+    def get(self, ids: List[str], include: Optional[List[str]] = None) -> Dict[str, Any]:
+        return self._call("get", ids, include)
+
+class ShardedIndex:
+    """Vector index partitioned across shards with scatter-gather queries
+
+    Documents are routed by a stable hash of their id, or of the metadata
+    field named by `shard_key`. Queries fan out to every shard concurrently,
+    each shard returns its own top-k, and the sorted per-shard lists are
+    k-way merged by distance.
+
+    `read_only_shards` (e.g. restored snapshots) take part in queries but
+    never receive new documents.
+    """
+
+    def __init__(self, shards: List[Any], shard_key: str = "", read_only_shards: Optional[List[Any]] = None):
+        if not shards:
+            raise ValueError("At least one shard is required")
+        self.shards = shards
+        self.shard_key = shard_key
+        self.read_only_shards = read_only_shards or []
+
+    @property
+    def all_shards(self) -> List[Any]:
+        return self.shards + self.read_only_shards
+
+    def _route(self, doc_id: str, metadata: Dict[str, Any]) -> Any:
+        key = str(metadata.get(self.shard_key, "")) if self.shard_key else doc_id
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return self.shards[int.from_bytes(digest, "big") % len(self.shards)]
+
+    async def add(
+        self,
+        doc_id: str,
+        embedding: List[float],
+        document: str,
+        metadata: Dict[str, Any]
+    ) -> None:
+        shard = self._route(doc_id, metadata)
+        await asyncio.to_thread(shard.add, [doc_id], [embedding], [document], [metadata])
+
+    async def query(self, embedding: List[float], top_k: int) -> List[Hit]:
+        """Query every shard and merge the results into a global top-k"""
+        shards = self.all_shards
+        results = await asyncio.gather(
+            *(asyncio.to_thread(shard.query, embedding, top_k) for shard in shards),
+            return_exceptions=True
+        )
+
+        shard_hits = []
+        for shard, result in zip(shards, results):
+            if isinstance(result, Exception):
+                logger.error(f"Shard {getattr(shard, 'address', shard.name)} query failed: {str(result)}")
+                continue
+            shard_hits.append(result)
+
+        if not shard_hits:
+            raise RuntimeError("All vector shards failed")
+        if len(shard_hits) < len(shards):
+            logger.warning(f"Partial search results from {len(shard_hits)}/{len(shards)} shards")
+
+        merged = heapq.merge(*shard_hits, key=lambda hit: hit["distance"])
+        return list(islice(merged, top_k))
+
+    async def count(self) -> int:
+        counts = await asyncio.gather(*(asyncio.to_thread(shard.count) for shard in self.all_shards))
+        return sum(counts)
+
+    async def drop(self) -> None:
+        """Delete this index's collection from every writable shard"""
+        await asyncio.gather(*(asyncio.to_thread(shard.drop) for shard in self.shards))
+
+    async def ids(self) -> List[List[str]]:
+        """Document ids held by each shard, in `all_shards` order"""
+        return await asyncio.gather(*(asyncio.to_thread(shard.ids) for shard in self.all_shards))
+
+    async def iter_documents(
+        self,
+        exclude: Optional[Set[str]] = None,
+        batch_size: int = 256,
+        include: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield stored documents in batches, skipping ids in `exclude`
+
+        `include` limits the fetched fields (see GET_FIELDS), e.g. to avoid
+        shipping vectors when only metadata is needed.
+        """
+        exclude = exclude or set()
+        for shard, shard_ids in zip(self.all_shards, await self.ids()):
+            pending = [doc_id for doc_id in shard_ids if doc_id not in exclude]
+            for start in range(0, len(pending), batch_size):
+                yield await asyncio.to_thread(shard.get, pending[start:start + batch_size], include)
+
+def _authkey() -> bytes:
+    """Shard authkey from settings; refuses unset or placeholder secrets"""
+    if settings.VECTOR_SHARD_AUTHKEY in _INSECURE_AUTHKEYS:
+        raise RuntimeError("VECTOR_SHARD_AUTHKEY must be set to a private secret to use shard servers")
+    return settings.VECTOR_SHARD_AUTHKEY.encode()
+
+def _json_default(value):
+    # numpy scalars/arrays coming back from Chroma
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _send_json(conn: Connection, message: Any) -> None:
+    # JSON rather than Connection.send, which would unpickle on the peer
+    conn.send_bytes(json.dumps(message, default=_json_default).encode())
+
+def _recv_json(conn: Connection) -> Any:
+    return json.loads(conn.recv_bytes())
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+def _legacy_root_shard(collection_name: str) -> Optional[LocalShard]:
+    """Non-empty collection left in the unsharded CHROMA_PERSIST_DIRECTORY layout"""
+    if not os.path.isdir(settings.CHROMA_PERSIST_DIRECTORY):
+        return None
+    client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
+    try:
+        count = client.get_collection(collection_name).count()
+    except Exception:
+        return None
+    if count == 0:
+        return None
+
+    logger.warning(
+        f"Collection '{collection_name}' in {settings.CHROMA_PERSIST_DIRECTORY} holds {count} documents"
+        f" from before sharding; serving it read-only. Run a model migration or re-ingest to move them into shards."
+    )
+    return LocalShard(client, collection_name)
+
+def build_index(collection_name: Optional[str] = None, include_snapshots: bool = True) -> ShardedIndex:
+    """Build the index described by the VECTOR_SHARD_* settings"""
+    collection_name = collection_name or settings.CHROMA_COLLECTION_NAME
+
+    if settings.VECTOR_SHARD_ADDRESSES:
+        authkey = _authkey()
+        shards = [
+            RemoteShard(_parse_address(address), collection_name, timeout=settings.VECTOR_SHARD_TIMEOUT, authkey=authkey)
+            for address in settings.VECTOR_SHARD_ADDRESSES
+        ]
+    elif settings.VECTOR_SHARD_COUNT <= 1:
+        # Unsharded layout, compatible with existing chroma_db directories
+        shards = [LocalShard.open(settings.CHROMA_PERSIST_DIRECTORY, collection_name)]
+    else:
+        shards = [
+            LocalShard.open(os.path.join(settings.CHROMA_PERSIST_DIRECTORY, f"shard_{i}"), collection_name)
+            for i in range(settings.VECTOR_SHARD_COUNT)
+        ]
+
+    read_only_shards = []
+    if settings.VECTOR_SHARD_ADDRESSES or settings.VECTOR_SHARD_COUNT > 1:
+        legacy_shard = _legacy_root_shard(collection_name)
+        if legacy_shard is not None:
+            read_only_shards.append(legacy_shard)
+    if include_snapshots and settings.SNAPSHOT_RESTORE_DIRECTORY:
+        read_only_shards.append(SnapshotShard(settings.SNAPSHOT_RESTORE_DIRECTORY))
+
+    logger.info(
+        f"Vector index '{collection_name}' using {len(shards)} shard(s)"
+        f" and {len(read_only_shards)} snapshot shard(s)"
+    )
+    return ShardedIndex(shards, shard_key=settings.VECTOR_SHARD_KEY, read_only_shards=read_only_shards)
+
+def _handle_connection(conn: Connection, client: "chromadb.ClientAPI", shards: Dict[str, LocalShard], lock: threading.Lock):
+    with conn:
+        while True:
+            try:
+                op, collection_name, args = _recv_json(conn)
+            except EOFError:
+                return
+            except ValueError as e:
+                logger.error(f"Malformed shard request: {str(e)}")
+                return
+
+            try:
+                if op not in SHARD_OPS:
+                    raise ValueError(f"Unsupported shard operation: {op}")
+                with lock:
+                    if collection_name not in shards:
+                        shards[collection_name] = LocalShard(client, collection_name)
+                shard = shards[collection_name]
+                result = getattr(shard, op)(*args)
+                if op == "drop":
+                    with lock:
+                        shards.pop(collection_name, None)
+                _send_json(conn, ["ok", result])
+            except Exception as e:
+                logger.error(f"Error handling shard {op}: {str(e)}")
+                _send_json(conn, ["error", str(e)])
+
+def serve_shard(
+    host: str,
+    port: int,
+    path: str,
+    authkey: Optional[bytes] = None,
+    ready: Optional[Connection] = None
+) -> None:
+    """Serve the collections stored under `path` to RemoteShard clients
+
+    Port 0 binds any free port; the bound address is sent on `ready` once
+    the server accepts connections.
+    """
+    authkey = authkey or _authkey()
+    client = chromadb.PersistentClient(path=path)
+    shards: Dict[str, LocalShard] = {}
+    lock = threading.Lock()
+
+    with Listener((host, port), authkey=authkey) as listener:
+        host, port = listener.address
+        logger.info(f"Vector shard serving {path} on {host}:{port}")
+        if ready is not None:
+            ready.send([host, port])
+            ready.close()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.error(f"Error accepting shard connection: {str(e)}")
+                continue
+            threading.Thread(
+                target=_handle_connection,
+                args=(conn, client, shards, lock),
+                daemon=True
+            ).start()
+
+def spawn_local_shards(
+    count: int,
+    base_port: int,
+    base_path: str,
+    host: str = "127.0.0.1",
+    timeout: float = 60.0
+) -> Tuple[List[multiprocessing.Process], List[str]]:
+    """Start `count` shard servers as local processes (development and testing)
+
+    With `base_port` 0 each server binds a free port. Returns once every
+    server accepts connections, with the addresses they are bound to.
+    """
+    authkey = _authkey()
+    processes, pipes = [], []
+    for i in range(count):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=serve_shard,
+            args=(host, base_port + i if base_port else 0, os.path.join(base_path, f"shard_{i}"), authkey, sender),
+            daemon=True
+        )
+        process.start()
+        sender.close()
+        processes.append(process)
+        pipes.append(receiver)
+
+    addresses = []
+    deadline = time.monotonic() + timeout
+    for i, receiver in enumerate(pipes):
+        try:
+            if not receiver.poll(max(deadline - time.monotonic(), 0)):
+                raise TimeoutError(f"not listening after {timeout}s")
+            bound_host, bound_port = receiver.recv()
+        except (EOFError, TimeoutError) as e:
+            for process in processes:
+                process.terminate()
+            raise RuntimeError(f"Shard server {i} failed to start: {str(e) or 'exited'}") from e
+        finally:
+            receiver.close()
+        addresses.append(f"{bound_host}:{bound_port}")
+    return processes, addresses
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a vector index shard")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--path", required=True, help="ChromaDB persist directory for this shard")
+    args = parser.parse_args()
+
+    from src.utils.logger import setup_logging
+    setup_logging()
+    serve_shard(args.host, args.port, args.path)
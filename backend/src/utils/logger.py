@@ -1,14 +1,38 @@
+import atexit
 import logging
+import queue
 import sys
-from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from src.core.config import settings
+
+_listener: Optional[QueueListener] = None
 
 def setup_logging():
-    """Setup logging configuration"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler("multimodal_backend.log")
-        ]
-    )
\ No newline at end of file
+    """Setup logging configuration
+
+    Records are pushed onto an in-memory queue and written to stdout and the
+    log file by a background listener thread, so request handlers never block
+    on log I/O.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    handlers = [
+        logging.StreamHandler(sys.stdout),
+        logging.FileHandler(settings.LOG_FILE)
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
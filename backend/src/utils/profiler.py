@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import secrets
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_active_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+
+class RequestProfile:
+    """Trace artifacts captured for a single profiled request"""
+
+    def __init__(self, method: str, path: str, trace_dir: Path):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.directory = trace_dir / self.profile_id
+        self.started_at = datetime.now().isoformat()
+        self.start_time = time.perf_counter()
+        self.python_profile: Optional[cProfile.Profile] = None
+        self.files: List[str] = []
+        self.token: Optional[contextvars.Token] = None
+        # Set once the request finishes; tasks that copied its context may outlive it
+        self.closed = False
+        self._torch_sections = 0
+        self._lock = threading.Lock()
+
+    def add_torch_trace(self, name: str, prof) -> None:
+        """Export a finished torch profiler run as a Chrome trace"""
+        with self._lock:
+            self._torch_sections += 1
+            filename = f"torch_{self._torch_sections:03d}_{name}.json"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        prof.export_chrome_trace(str(self.directory / filename))
+        with self._lock:
+            self.files.append(filename)
+
+class RequestProfiler:
+    """Admin-controlled profiling of sampled or explicitly flagged requests
+
+    The Python-level profile (cProfile) covers the event loop thread, so only
+    one request is profiled with it at a time; concurrent profiled requests
+    still capture torch traces of the model forward passes.
+    """
+
+    def __init__(self):
+        self.enabled = settings.PROFILING_ENABLED
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.trace_dir = Path(settings.PROFILING_TRACE_DIR)
+        self._cprofile_lock = threading.Lock()
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None) -> None:
+        """Update profiling mode at runtime"""
+        if enabled is not None:
+            self.enabled = enabled
+        if sample_rate is not None:
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.sample_rate = sample_rate
+        logger.info(f"Profiling configured: enabled={self.enabled}, sample_rate={self.sample_rate}")
+
+    def should_profile(self, headers: Mapping[str, str]) -> bool:
+        """Decide whether a request is profiled"""
+        if not self.enabled:
+            return False
+        flag = headers.get(settings.PROFILING_HEADER)
+        if flag and settings.ADMIN_TOKEN and secrets.compare_digest(flag, settings.ADMIN_TOKEN):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, method: str, path: str) -> RequestProfile:
+        """Begin profiling the current request context"""
+        profile = RequestProfile(method, path, self.trace_dir)
+        if self._cprofile_lock.acquire(blocking=False):
+            profile.python_profile = cProfile.Profile()
+            profile.python_profile.enable()
+        profile.token = _active_profile.set(profile)
+        return profile
+
+    async def finish(self, profile: RequestProfile, status_code: Optional[int] = None) -> None:
+        """Stop profiling and persist the collected traces"""
+        duration = time.perf_counter() - profile.start_time
+        profile.closed = True
+        _active_profile.reset(profile.token)
+        if profile.python_profile is not None:
+            profile.python_profile.disable()
+            self._cprofile_lock.release()
+
+        try:
+            await asyncio.to_thread(self._write, profile, duration, status_code)
+        except Exception as e:
+            logger.error(f"Error writing profile {profile.profile_id}: {str(e)}")
+
+    def _write(self, profile: RequestProfile, duration: float, status_code: Optional[int]) -> None:
+        profile.directory.mkdir(parents=True, exist_ok=True)
+
+        if profile.python_profile is not None:
+            profile.python_profile.dump_stats(str(profile.directory / "python.prof"))
+            summary = io.StringIO()
+            stats = pstats.Stats(profile.python_profile, stream=summary)
+            stats.sort_stats("cumulative").print_stats(50)
+            (profile.directory / "python.txt").write_text(summary.getvalue())
+            profile.files.extend(["python.prof", "python.txt"])
+
+        meta = {
+            "profile_id": profile.profile_id,
+            "method": profile.method,
+            "path": profile.path,
+            "status_code": status_code,
+            "started_at": profile.started_at,
+            "duration": duration,
+            "files": profile.files
+        }
+        (profile.directory / "meta.json").write_text(json.dumps(meta, indent=2))
+        logger.info(f"Captured profile {profile.profile_id} for {profile.method} {profile.path}")
+        self._prune()
+
+    def _prune(self) -> None:
+        """Keep only the most recent traces"""
+        profiles = sorted(
+            (d for d in self.trace_dir.iterdir() if d.is_dir()),
+            key=lambda d: d.stat().st_mtime,
+            reverse=True
+        )
+        for stale in profiles[settings.PROFILING_MAX_TRACES:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """List stored profiles, newest first"""
+        if not self.trace_dir.exists():
+            return []
+        profiles = []
+        for meta_path in self.trace_dir.glob("*/meta.json"):
+            try:
+                profiles.append(json.loads(meta_path.read_text()))
+            except Exception as e:
+                logger.error(f"Error reading profile metadata {meta_path}: {str(e)}")
+        return sorted(profiles, key=lambda p: p["started_at"], reverse=True)
+
+    def get_trace_file(self, profile_id: str, filename: str) -> Optional[Path]:
+        """Resolve a stored trace file, or None if it is not part of a profile"""
+        meta_path = self.trace_dir / profile_id / "meta.json"
+        if "/" in profile_id or not meta_path.is_file():
+            return None
+        meta = json.loads(meta_path.read_text())
+        if filename not in meta["files"] and filename != "meta.json":
+            return None
+        return self.trace_dir / profile_id / filename
+
+@contextmanager
+def torch_section(name: str):
+    """Run a block under the torch profiler when the current request is profiled"""
+    profile = _active_profile.get()
+    if profile is None or profile.closed:
+        yield
+        return
+
+    import torch
+    from torch.profiler import ProfilerActivity, profile as torch_profile, record_function
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+
+    with torch_profile(activities=activities, record_shapes=True) as prof:
+        with record_function(name):
+            yield
+    try:
+        profile.add_torch_trace(name, prof)
+    except Exception as e:
+        logger.error(f"Error exporting torch trace for {name}: {str(e)}")
+
+# Singleton instance
+request_profiler = RequestProfiler()
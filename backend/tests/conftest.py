@@ -0,0 +1,94 @@
+import importlib
+import sys
+import types
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.core.config import settings
+
+DIM = 8
+
+# Re-imported per test so they bind the stub processors and a temporary index
+SERVICE_MODULES = [
+    "src.services.embedding_service",
+    "src.services.rag_service",
+    "src.services.model_migration",
+    "src.api.endpoints"
+]
+
+def stub_vector(model_name, source):
+    rng = np.random.default_rng(zlib.crc32(f"{model_name}:{source}".encode()))
+    vector = rng.normal(size=DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+class StubTextProcessor:
+    def __init__(self, model_name=None):
+        self.model_name = model_name or settings.TEXT_MODEL_NAME
+        self.released = False
+
+    def encode_text(self, text):
+        texts = [text] if isinstance(text, str) else text
+        return np.stack([stub_vector(self.model_name, item) for item in texts])
+
+    def release(self):
+        self.released = True
+
+class StubImageProcessor:
+    def __init__(self, model_name=None):
+        self.model_name = model_name or settings.IMAGE_MODEL_NAME
+        self.released = False
+
+    async def extract_embeddings_with_hash(self, image_path, cache=False):
+        from src.services.phash_index import compute_phash
+
+        image_hash = compute_phash(Image.open(image_path))
+        return stub_vector(self.model_name, image_hash), image_hash
+
+    def release(self):
+        self.released = True
+
+def _stub_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    """Migration, RAG and embedding services over stub models and a fresh local index"""
+    pytest.importorskip("chromadb")
+    pytest.importorskip("src.models.schemas")
+    for name, value in {
+        "CHROMA_PERSIST_DIRECTORY": str(tmp_path / "chroma_db"),
+        "CHROMA_COLLECTION_NAME": "test",
+        "ACTIVE_INDEX_FILE": str(tmp_path / "chroma_db" / "active_index.json"),
+        "VECTOR_SHARD_COUNT": 1,
+        "VECTOR_SHARD_ADDRESSES": [],
+        "SNAPSHOT_RESTORE_DIRECTORY": "",
+        "TEXT_MODEL_NAME": "text-a",
+        "IMAGE_MODEL_NAME": "image-a",
+        "PHASH_DEDUP_ENABLED": False,
+        "MIGRATION_SWITCH_GRACE_SECONDS": 0.0
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+    monkeypatch.setitem(sys.modules, "src.services.text_processor", _stub_module(
+        "src.services.text_processor", TextProcessor=StubTextProcessor, text_processor=StubTextProcessor()
+    ))
+    monkeypatch.setitem(sys.modules, "src.services.image_processor", _stub_module(
+        "src.services.image_processor", ImageProcessor=StubImageProcessor, image_processor=StubImageProcessor()
+    ))
+    from src.services import phash_index
+
+    monkeypatch.setattr(phash_index, "phash_index", phash_index.PerceptualHashIndex())
+    saved = {name: sys.modules.pop(name, None) for name in SERVICE_MODULES}
+    yield types.SimpleNamespace(**{
+        name.rsplit(".", 1)[1]: importlib.import_module(name) for name in SERVICE_MODULES[:-1]
+    })
+
+    for name, module in saved.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
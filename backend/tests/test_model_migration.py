@@ -0,0 +1,160 @@
+import asyncio
+import json
+import pytest
+
+from src.core.config import Settings, settings
+from conftest import StubTextProcessor, stub_vector
+
+def _add_text_documents(services, count):
+    async def add_all():
+        ids = []
+        for i in range(count):
+            embedding_data = await services.embedding_service.embedding_service.generate_embedding(text=f"document {i}")
+            ids.append(await services.rag_service.rag_service.add_document(
+                content=f"document {i}",
+                media_type=embedding_data["media_type"],
+                embedding=embedding_data["embedding"],
+                model_used=embedding_data["model_used"]
+            ))
+        return ids
+
+    return asyncio.run(add_all())
+
+def _add_orphaned_image(services):
+    """Image document whose source file is gone, so it cannot be re-embedded"""
+    from src.models.schemas import MediaType
+
+    return asyncio.run(services.rag_service.rag_service.add_document(
+        content="missing image",
+        media_type=MediaType.IMAGE,
+        embedding=stub_vector("image-a", "missing").tolist(),
+        metadata={"image_path": "/nonexistent/image.jpg"},
+        model_used=services.embedding_service.embedding_service.model_used
+    ))
+
+def _collections():
+    import chromadb
+
+    client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
+    return {getattr(collection, "name", collection) for collection in client.list_collections()}
+
+def _migration(services, **options):
+    return services.model_migration.ModelMigration(
+        text_model_name="text-b",
+        image_model_name="image-a",
+        max_docs_per_second=options.pop("max_docs_per_second", 1000.0),
+        batch_size=4,
+        **options
+    )
+
+def test_lost_documents_block_the_switch_unless_forced(services):
+    _add_text_documents(services, 5)
+    orphan_id = _add_orphaned_image(services)
+    rag_service = services.rag_service.rag_service
+
+    blocked = _migration(services)
+    asyncio.run(blocked.run())
+    assert blocked.state == "blocked"
+    assert blocked.status()["lost_ids"] == [orphan_id]
+    assert rag_service.model_used == "text-a+image-a"
+    assert blocked.collection_name not in _collections()
+
+    forced = _migration(services, force=True)
+    asyncio.run(forced.run())
+    assert forced.state == "completed_with_losses"
+    assert forced.status()["lost_ids"] == [orphan_id]
+    assert rag_service.model_used == "text-b+image-a"
+    assert asyncio.run(rag_service.index.count()) == 5
+    assert settings.CHROMA_COLLECTION_NAME == forced.collection_name
+    with open(settings.ACTIVE_INDEX_FILE) as file:
+        assert json.load(file)["collection"] == forced.collection_name
+
+def test_writes_route_by_model_used_through_the_switch(services):
+    _add_text_documents(services, 3)
+    rag_service = services.rag_service.rag_service
+    embedding_service = services.embedding_service.embedding_service
+    old_index, old_models = rag_service.index, rag_service.model_used
+    old_text_processor = embedding_service.text_processor
+
+    new_text_processor = StubTextProcessor("text-b")
+    shadow = services.rag_service.build_index("test_shadow", False)
+    embedding_service.use_processors(new_text_processor, embedding_service.image_processor)
+    rag_service.switch_index(shadow, embedding_service.model_used, [old_text_processor])
+
+    def add(model_used):
+        return asyncio.run(rag_service.add_document(
+            content="late write",
+            media_type="text",
+            embedding=stub_vector(model_used, "late write").tolist(),
+            model_used=model_used
+        ))
+
+    add(old_models)
+    add("text-b+image-a")
+    assert asyncio.run(old_index.count()) == 4
+    assert asyncio.run(shadow.count()) == 1
+
+    asyncio.run(rag_service.drop_retired_index())
+    assert old_text_processor.released
+    assert not new_text_processor.released
+    with pytest.raises(services.rag_service.StaleEmbeddingError):
+        add(old_models)
+    assert asyncio.run(shadow.count()) == 1
+
+def test_cancel_drops_the_shadow_collection(services):
+    _add_text_documents(services, 10)
+    migration = _migration(services, max_docs_per_second=5.0)
+
+    async def run_and_cancel():
+        task = asyncio.create_task(migration.run())
+        while migration.processed < 2:
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run_and_cancel())
+    assert migration.state == "cancelled"
+    assert migration.collection_name not in _collections()
+    assert services.rag_service.rag_service.model_used == "text-a+image-a"
+
+@pytest.fixture
+def active_index_file(tmp_path, monkeypatch):
+    for name in ("CHROMA_COLLECTION_NAME", "TEXT_MODEL_NAME", "IMAGE_MODEL_NAME"):
+        monkeypatch.delenv(name, raising=False)
+    path = tmp_path / "active_index.json"
+    path.write_text(json.dumps({
+        "collection": "multimodal_rag_v1",
+        "text_model": "text-b",
+        "image_model": "image-b",
+        "switched_at": "2024-01-01T00:00:00"
+    }))
+    return str(path)
+
+def test_active_index_applies_without_explicit_settings(active_index_file):
+    config = Settings(ACTIVE_INDEX_FILE=active_index_file)
+    assert config.apply_active_index() == []
+    assert (config.CHROMA_COLLECTION_NAME, config.TEXT_MODEL_NAME, config.IMAGE_MODEL_NAME) == (
+        "multimodal_rag_v1", "text-b", "image-b"
+    )
+
+def test_active_index_accepts_matching_explicit_model(active_index_file, monkeypatch):
+    monkeypatch.setenv("TEXT_MODEL_NAME", "text-b")
+    config = Settings(ACTIVE_INDEX_FILE=active_index_file)
+    assert config.apply_active_index() == []
+    assert (config.CHROMA_COLLECTION_NAME, config.IMAGE_MODEL_NAME) == ("multimodal_rag_v1", "image-b")
+
+def test_active_index_refuses_other_explicit_model(active_index_file, monkeypatch):
+    monkeypatch.setenv("TEXT_MODEL_NAME", "text-a")
+    config = Settings(ACTIVE_INDEX_FILE=active_index_file)
+    with pytest.raises(RuntimeError, match="TEXT_MODEL_NAME"):
+        config.apply_active_index()
+
+def test_explicit_collection_ignores_active_index(active_index_file, monkeypatch):
+    monkeypatch.setenv("CHROMA_COLLECTION_NAME", "multimodal_rag")
+    monkeypatch.setenv("TEXT_MODEL_NAME", "text-a")
+    config = Settings(ACTIVE_INDEX_FILE=active_index_file)
+    conflicts = config.apply_active_index()
+    assert len(conflicts) == 1
+    assert (config.CHROMA_COLLECTION_NAME, config.TEXT_MODEL_NAME) == ("multimodal_rag", "text-a")
+    assert config.IMAGE_MODEL_NAME != "image-b"
@@ -0,0 +1,96 @@
+import asyncio
+import io
+import os
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("cv2")
+
+from src.core.config import settings
+from src.services.phash_index import PerceptualHashIndex, compute_phash, hamming_distance
+
+def _image(seed):
+    rng = np.random.default_rng(seed)
+    pixels = (rng.random((8, 8, 3)) * 255).astype(np.uint8)
+    return Image.fromarray(pixels).resize((256, 256), Image.BICUBIC)
+
+def _recompressed(image, size=(180, 140), quality=40):
+    buffer = io.BytesIO()
+    image.resize(size).save(buffer, "JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+def test_resized_recompressed_image_is_near_duplicate():
+    for seed in range(5):
+        image = _image(seed)
+        assert hamming_distance(compute_phash(image), compute_phash(_recompressed(image))) <= settings.PHASH_MAX_DISTANCE
+
+def test_unrelated_image_is_not_near_duplicate():
+    for seed in range(5):
+        assert hamming_distance(compute_phash(_image(seed)), compute_phash(_image(seed + 100))) > settings.PHASH_MAX_DISTANCE
+
+def test_find_documents_returns_nearest_first():
+    index = PerceptualHashIndex()
+    query = compute_phash(_image(0))
+    for doc_id, flipped_bits in (("far", 20), ("near", 1), ("exact", 0), ("edge", 5), ("middle", 3)):
+        index.add_document(query ^ ((1 << flipped_bits) - 1), doc_id)
+    index.add_document(query, "exact-copy")
+
+    assert index.find_documents(query, 5) == ["exact", "exact-copy", "near", "middle", "edge"]
+    assert index.find_documents(query, 0) == ["exact", "exact-copy"]
+    assert len(index) == 5
+
+def test_embedding_cache_is_bounded():
+    index = PerceptualHashIndex(cache_size=2)
+    hashes = [compute_phash(_image(seed)) for seed in range(50)]
+    for image_hash in hashes:
+        index.add_embedding("model", image_hash, np.full(4, image_hash % 7, dtype=np.float32))
+
+    assert len(index._embeddings) == 2
+    assert len(index._cached) <= 2 * index.cache_size
+    assert len(index) == 0
+    assert index.find_embedding("model", hashes[-1], 0) is not None
+    assert index.find_embedding("model", hashes[0], 0) is None
+    assert index.find_embedding("other-model", hashes[-1], 0) is None
+
+@pytest.fixture
+def endpoints(services, tmp_path, monkeypatch):
+    """Upload endpoints with near-duplicate detection on, saving uploads under tmp_path"""
+    pytest.importorskip("fastapi")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "PHASH_DEDUP_ENABLED", True)
+    import src.api.endpoints as endpoints
+
+    return endpoints
+
+def _upload(endpoints, image):
+    from fastapi import UploadFile
+
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG")
+    buffer.seek(0)
+    return asyncio.run(endpoints.add_document(
+        content="photo",
+        media_type="image",
+        image=UploadFile(file=buffer, filename="photo.jpg")
+    ))
+
+def test_add_document_flags_near_duplicates(endpoints, services):
+    original = _upload(endpoints, _image(0))
+    assert original["status"] == "success" and original["duplicate_of"] == []
+
+    duplicate = _upload(endpoints, _recompressed(_image(0)))
+    assert duplicate["status"] == "success"
+    assert duplicate["duplicate_of"] == [original["document_id"]]
+    stored = services.rag_service.rag_service.index.shards[0].get([duplicate["document_id"]], ["metadatas"])
+    assert stored["metadatas"][0]["duplicate_of"] == original["document_id"]
+
+    assert _upload(endpoints, _image(1))["duplicate_of"] == []
+
+def test_add_document_rejects_near_duplicates(endpoints, monkeypatch):
+    monkeypatch.setattr(settings, "PHASH_REJECT_DUPLICATES", True)
+    original = _upload(endpoints, _image(0))
+
+    rejected = _upload(endpoints, _recompressed(_image(0)))
+    assert rejected == {"document_id": None, "status": "duplicate", "duplicate_of": [original["document_id"]]}
+    assert len(os.listdir(endpoints.UPLOAD_DIR)) == 1
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import pytest
+
+from src.core.config import settings
+from src.utils.profiler import RequestProfiler, _active_profile, torch_section
+
+@pytest.fixture
+def profiler(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "admin-secret")
+    profiler = RequestProfiler()
+    profiler.trace_dir = tmp_path / "profiles"
+    profiler.configure(enabled=True, sample_rate=0.0)
+    return profiler
+
+def test_header_forces_profile_only_with_admin_token(profiler):
+    assert profiler.should_profile({settings.PROFILING_HEADER: "admin-secret"})
+    assert not profiler.should_profile({settings.PROFILING_HEADER: "guess"})
+    assert not profiler.should_profile({settings.PROFILING_HEADER: ""})
+    assert not profiler.should_profile({})
+
+def test_sample_rate_bounds(profiler):
+    assert not any(profiler.should_profile({}) for _ in range(100))
+    profiler.configure(sample_rate=1.0)
+    assert all(profiler.should_profile({}) for _ in range(100))
+    profiler.configure(enabled=False)
+    assert not profiler.should_profile({settings.PROFILING_HEADER: "admin-secret"})
+    with pytest.raises(ValueError):
+        profiler.configure(sample_rate=1.5)
+
+def test_header_ignored_without_admin_token(profiler, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "")
+    assert not profiler.should_profile({settings.PROFILING_HEADER: ""})
+
+def _profile_request(profiler):
+    async def request():
+        profile = profiler.start("GET", "/api/v1/search")
+        await profiler.finish(profile, 200)
+        return profile
+
+    return asyncio.run(request())
+
+def test_get_trace_file_only_serves_listed_files(profiler):
+    profile = _profile_request(profiler)
+    (profile.directory / "unlisted.txt").write_text("not a trace")
+
+    assert profiler.get_trace_file(profile.profile_id, "python.txt") == profile.directory / "python.txt"
+    assert profiler.get_trace_file(profile.profile_id, "meta.json") == profile.directory / "meta.json"
+    assert profiler.get_trace_file(profile.profile_id, "unlisted.txt") is None
+    assert profiler.get_trace_file(profile.profile_id, "../meta.json") is None
+    assert profiler.get_trace_file("missing", "python.txt") is None
+    assert profiler.list_profiles()[0]["profile_id"] == profile.profile_id
+
+def test_torch_section_skips_closed_profiles(profiler, monkeypatch):
+    # Any attempt to start the torch profiler would fail the import
+    monkeypatch.setitem(sys.modules, "torch", None)
+
+    async def request_with_background_task():
+        profile = profiler.start("POST", "/api/v1/documents")
+        started = asyncio.Event()
+
+        async def background():
+            await started.wait()
+            with torch_section("background"):
+                return _active_profile.get()
+
+        # Copies the request context, like tasks spawned by a handler
+        task = asyncio.create_task(background())
+        await profiler.finish(profile, 200)
+        started.set()
+        return profile, await task
+
+    profile, seen = asyncio.run(request_with_background_task())
+    assert seen is profile and profile.closed
+    assert not any(name.startswith("torch_") for name in profile.files)
@@ -0,0 +1,125 @@
+import asyncio
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from src.core.config import settings
+from src.services.snapshot import SnapshotShard, SnapshotStore
+from src.services.vector_shards import LocalShard, ShardedIndex
+
+DIM = 8
+
+@pytest.fixture
+def index(tmp_path):
+    return ShardedIndex([LocalShard.open(str(tmp_path / f"shard_{i}"), "test") for i in range(2)])
+
+def _add(index, start, stop):
+    rng = np.random.default_rng(start)
+
+    async def add_all():
+        for i in range(start, stop):
+            await index.add(f"doc{i}", rng.normal(size=DIM).tolist(), f"content {i}", {"n": i})
+
+    asyncio.run(add_all())
+
+def test_incremental_snapshots_serve_same_results(index, tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    _add(index, 0, 30)
+    base = asyncio.run(store.create(index))
+    assert (base["sequence"], base["parent_sequence"], base["count"]) == (1, 0, 30)
+    assert asyncio.run(store.create(index)) is None
+
+    _add(index, 30, 45)
+    delta = asyncio.run(store.create(index))
+    assert (delta["sequence"], delta["parent_sequence"], delta["count"]) == (2, 1, 15)
+
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    assert shard.count() == 45
+    query = np.random.default_rng(99).normal(size=DIM).tolist()
+    expected = asyncio.run(index.query(query, 5))
+    hits = shard.query(query, 5)
+    assert [hit["id"] for hit in hits] == [hit["id"] for hit in expected]
+    assert [hit["distance"] for hit in hits] == pytest.approx([hit["distance"] for hit in expected], rel=1e-4)
+
+def test_get_looks_up_ids(index, tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    _add(index, 0, 10)
+    asyncio.run(store.create(index))
+    _add(index, 10, 20)
+    asyncio.run(store.create(index))
+
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    results = shard.get(["doc15", "missing", "doc3"])
+    assert results["ids"] == ["doc15", "doc3"]
+    assert results["documents"] == ["content 15", "content 3"]
+    assert results["metadatas"] == [{"n": 15}, {"n": 3}]
+    assert len(results["embeddings"][0]) == DIM
+
+def test_get_metadata_only(index, tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    _add(index, 0, 5)
+    asyncio.run(store.create(index))
+
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    assert shard.get(["doc2"], include=["metadatas"]) == {"ids": ["doc2"], "metadatas": [{"n": 2}]}
+    batches = asyncio.run(_collect(index.iter_documents(include=["metadatas"])))
+    assert all(set(batch) == {"ids", "metadatas"} for batch in batches)
+    assert sum(len(batch["ids"]) for batch in batches) == 5
+
+async def _collect(iterator):
+    return [item async for item in iterator]
+
+def test_model_change_starts_new_base(index, tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    _add(index, 0, 10)
+    asyncio.run(store.create(index))
+    _add(index, 10, 12)
+    asyncio.run(store.create(index))
+
+    monkeypatch.setattr(settings, "TEXT_MODEL_NAME", "another-text-model")
+    rebased = asyncio.run(store.create(index))
+    assert (rebased["sequence"], rebased["parent_sequence"], rebased["count"]) == (3, 0, 12)
+    assert [reader.sequence for reader in store.chain()] == [3]
+
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    assert shard.count() == 12
+    assert [reader.sequence for reader in shard.readers] == [3]
+
+def test_snapshot_shard_ignores_other_models(index, tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    _add(index, 0, 10)
+    asyncio.run(store.create(index))
+
+    monkeypatch.setattr(settings, "IMAGE_MODEL_NAME", "another-image-model")
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    assert shard.count() == 0
+    assert shard.query(np.zeros(DIM).tolist(), 5) == []
+
+def test_missing_delta_ends_the_chain(index, tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    for start, stop in ((0, 10), (10, 12), (12, 15)):
+        _add(index, start, stop)
+        asyncio.run(store.create(index))
+
+    store.get_path("snapshot-000002.mmsnap").unlink()
+    assert [reader.sequence for reader in store.chain()] == [1]
+    assert store.chain_gap() == {"after_sequence": 1, "next_sequence": 3, "missing_parent_sequence": 2}
+
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    assert shard.count() == 10
+    assert shard.gap == store.chain_gap()
+
+def test_concurrent_creates_get_distinct_sequences(index, tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    _add(index, 0, 300)
+
+    async def create_twice():
+        return await asyncio.gather(store.create(index), store.create(index))
+
+    first, second = asyncio.run(create_twice())
+    assert (first["sequence"], first["count"]) == (1, 300)
+    assert second is None
+    shard = SnapshotShard(str(tmp_path / "snapshots"))
+    assert sorted(shard.ids(), key=lambda doc_id: int(doc_id[3:])) == [f"doc{i}" for i in range(300)]
+    assert shard.get(["doc299"])["documents"] == ["content 299"]
@@ -0,0 +1,74 @@
+import asyncio
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from src.core.config import settings
+from src.services.vector_shards import RemoteShard, ShardedIndex, _parse_address, spawn_local_shards
+
+DIM = 16
+
+@pytest.fixture
+def shard_index(tmp_path, monkeypatch):
+    """Three shard server processes, on free ports, behind a ShardedIndex"""
+    monkeypatch.setattr(settings, "VECTOR_SHARD_AUTHKEY", "test-shard-key")
+    processes, addresses = spawn_local_shards(3, 0, str(tmp_path))
+    shards = [RemoteShard(_parse_address(address), "test", timeout=5.0) for address in addresses]
+
+    yield ShardedIndex(shards), processes
+
+    for process in processes:
+        process.terminate()
+        process.join()
+
+def _brute_force(vectors, query, top_k):
+    distances = {doc_id: float(((vector - query) ** 2).sum()) for doc_id, vector in vectors.items()}
+    return sorted(distances, key=distances.get)[:top_k]
+
+def _populate(index, count=60):
+    rng = np.random.default_rng(0)
+    vectors = {f"doc{i}": rng.normal(size=DIM).astype(np.float32) for i in range(count)}
+
+    async def add_all():
+        for doc_id, vector in vectors.items():
+            await index.add(doc_id, vector.tolist(), f"content of {doc_id}", {"n": doc_id})
+
+    asyncio.run(add_all())
+    return vectors
+
+def test_scatter_gather_matches_brute_force(shard_index):
+    index, _ = shard_index
+    vectors = _populate(index)
+
+    assert asyncio.run(index.count()) == len(vectors)
+    assert all(shard.count() > 0 for shard in index.shards)
+
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        query = rng.normal(size=DIM).astype(np.float32)
+        hits = asyncio.run(index.query(query.tolist(), 8))
+        assert [hit["id"] for hit in hits] == _brute_force(vectors, query, 8)
+        assert [hit["distance"] for hit in hits] == sorted(hit["distance"] for hit in hits)
+
+def test_failed_shard_returns_partial_results(shard_index):
+    index, processes = shard_index
+    vectors = _populate(index)
+
+    processes[0].terminate()
+    processes[0].join()
+    surviving = {
+        doc_id: vector for doc_id, vector in vectors.items()
+        if index._route(doc_id, {}) is not index.shards[0]
+    }
+
+    query = np.random.default_rng(2).normal(size=DIM).astype(np.float32)
+    hits = asyncio.run(index.query(query.tolist(), 8))
+    assert [hit["id"] for hit in hits] == _brute_force(surviving, query, 8)
+
+def test_drop_removes_collection_from_every_shard(shard_index):
+    index, _ = shard_index
+    _populate(index, count=12)
+
+    asyncio.run(index.drop())
+    assert asyncio.run(index.count()) == 0